@@ -1,12 +1,22 @@
-﻿from fastapi import APIRouter, HTTPException
+﻿from fastapi import APIRouter, HTTPException, UploadFile, File, Header
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 import uuid
+import os
+import asyncio
+import shutil
+import secrets
 from datetime import datetime
 
 from services.llm_service import generate_learning_content, generate_quiz
 from services.image_service import generate_image_url
 from services.audio_service import generate_audio
+from services.bundle_service import (
+    BUNDLE_DIR, IMAGE_TYPES, BundleError, BundleExistsError,
+    export_bundle, import_bundle, open_bundle
+)
+from services.profiling_service import list_reports, get_report
 from database.db import save_session, get_session
 
 router = APIRouter()
@@ -142,3 +152,135 @@ async def evaluate_quiz(request: QuizEvaluationRequest):
     except Exception as e:
         print(f" Error in /quiz/evaluate: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to evaluate quiz: {str(e)}")
+
+def _require_admin(token: str, env_var: str):
+    """Admin endpoints are only exposed when the given token env var is set and matches"""
+    admin_token = os.getenv(env_var)
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not token or not secrets.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+# Chunk size for streaming bundle assets straight out of the memory map
+BUNDLE_CHUNK_SIZE = 64 * 1024
+
+def _stream_view(view: memoryview):
+    """Yield a mapped asset chunk by chunk, so only one chunk is copied at a time"""
+    for start in range(0, len(view), BUNDLE_CHUNK_SIZE):
+        # Starlette's StreamingResponse only passes bytes through unchanged
+        yield bytes(view[start:start + BUNDLE_CHUNK_SIZE])
+
+def _load_bundle(session_id: str):
+    """Open a session's bundle and its lesson metadata, mapping errors to 404"""
+    try:
+        bundle = open_bundle(session_id)
+        if bundle is None:
+            raise HTTPException(status_code=404, detail="Bundle not found")
+        bundle.lesson()
+    except BundleError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return bundle
+
+@router.post("/bundles/{session_id}/export")
+async def export_lesson_bundle(session_id: str, x_admin_token: str = Header(None)):
+    """Pack a lesson (slides, quiz, audio, images) into one downloadable bundle"""
+    _require_admin(x_admin_token, "BUNDLE_ADMIN_TOKEN")
+    try:
+        path = await export_bundle(session_id)
+    except BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f" Error in /bundles/export: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to export bundle: {str(e)}")
+
+    if not path:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        filename=os.path.basename(path)
+    )
+
+def _save_upload(source, path: str):
+    with open(path, "wb") as f:
+        shutil.copyfileobj(source, f)
+
+@router.post("/bundles/import")
+async def import_lesson_bundle(file: UploadFile = File(...), x_admin_token: str = Header(None)):
+    """Import an uploaded lesson bundle without any LLM or TTS calls"""
+    _require_admin(x_admin_token, "BUNDLE_ADMIN_TOKEN")
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+    upload_path = os.path.join(BUNDLE_DIR, f"upload_{uuid.uuid4()}.tmp")
+    try:
+        await asyncio.to_thread(_save_upload, file.file, upload_path)
+        session_id = await import_bundle(upload_path)
+        return {"sessionId": session_id}
+    except BundleExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f" Error in /bundles/import: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to import bundle: {str(e)}")
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+@router.get("/bundles/{session_id}", response_model=LearnResponse)
+async def get_bundled_lesson(session_id: str):
+    """Serve a lesson from its bundle, with asset URLs pointing into the bundle"""
+    bundle = _load_bundle(session_id)
+    lesson = bundle.lesson()
+
+    slides = []
+    for slide, assets in zip(lesson['slides_content'], lesson['assets']):
+        asset_base = f"/api/bundles/{session_id}/assets"
+        slides.append(SlideData(
+            title=slide['title'],
+            content=slide['content'],
+            imageUrl=f"{asset_base}/{assets['image']}" if assets['image'] else generate_image_url(slide['title']),
+            audioUrl=f"{asset_base}/{assets['audio']}" if assets['audio'] else ""
+        ))
+
+    return LearnResponse(sessionId=session_id, slides=slides)
+
+@router.get("/bundles/{session_id}/assets/{name:path}")
+async def get_bundle_asset(session_id: str, name: str):
+    """Stream a single asset directly from the memory-mapped bundle"""
+    bundle = _load_bundle(session_id)
+    view = bundle.read(name)
+    if view is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    media_type = "application/octet-stream"
+    if name.endswith(".mp3"):
+        media_type = "audio/mpeg"
+    else:
+        for assets in bundle.lesson()['assets']:
+            if assets['image'] == name and assets['imageType'] in IMAGE_TYPES:
+                media_type = assets['imageType']
+
+    return StreamingResponse(
+        _stream_view(view),
+        media_type=media_type,
+        headers={
+            "Content-Length": str(len(view)),
+            "X-Content-Type-Options": "nosniff"
+        }
+    )
+
+@router.get("/admin/profiles")
+async def list_profiles(x_admin_token: str = Header(None)):
+    """List stored request profiles, newest first"""
+    _require_admin(x_admin_token, "PROFILE_ADMIN_TOKEN")
+    return {"profiles": await list_reports()}
+
+@router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: str = Header(None)):
+    """Get a full request profile: hot stacks and event-loop blocks"""
+    _require_admin(x_admin_token, "PROFILE_ADMIN_TOKEN")
+    report = await get_report(profile_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
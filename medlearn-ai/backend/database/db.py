@@ -55,3 +55,9 @@ async def get_session(session_id: str):
                     'created_at': row['created_at']
                 }
             return None
+
+async def delete_session(session_id: str):
+    """Delete a session from the database"""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        await db.commit()
@@ -7,6 +7,8 @@ import os
 
 from api.routes import router
 from database.db import init_db
+from services.bundle_service import import_bundles
+from services.profiling_service import ProfilingMiddleware
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +23,11 @@ async def lifespan(app: FastAPI):
     os.makedirs("data", exist_ok=True)
     print(" Database initialized")
     print(" Static folders ready")
+    # Optionally seed lessons from packed bundles (no LLM/TTS calls needed)
+    seed_dir = os.getenv("SEED_BUNDLES_DIR")
+    if seed_dir and os.path.isdir(seed_dir):
+        result = await import_bundles(seed_dir)
+        print(f" Seeded {len(result['imported'])} lessons from {seed_dir}")
     yield
     # Shutdown
     print(" Shutting down...")
@@ -48,6 +55,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling (sampled by PROFILE_SAMPLE_RATE or the admin X-Profile header)
+app.add_middleware(ProfilingMiddleware)
+
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
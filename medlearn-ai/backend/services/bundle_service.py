@@ -0,0 +1,397 @@
+import asyncio
+import httpx
+import json
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import uuid
+from collections import OrderedDict
+
+from services.image_service import generate_image_url
+from services.audio_service import AUDIO_DIR
+from database.db import save_session, get_session, delete_session
+
+# Directory for storing packed lesson bundles
+BUNDLE_DIR = "data/bundles"
+BUNDLE_EXTENSION = ".mlb"
+
+# Bundle layout (all integers little-endian):
+#   header:  magic (8 bytes) | version (u16) | entry count (u32)
+#   table:   per entry -> name length (u16) | name (utf-8) | offset (u64) | length (u64)
+#   payload: raw asset bytes, at the offsets recorded in the table
+MAGIC = b"MEDLRNB\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHI")
+ENTRY_NAME = struct.Struct("<H")
+ENTRY_SPAN = struct.Struct("<QQ")
+
+LESSON_ENTRY = "lesson.json"
+LESSON_KEYS = ("sessionId", "query", "slides_content", "quiz_questions", "assets")
+
+# Image types that may be served from a bundle; anything else is sent as
+# application/octet-stream so a bundle cannot serve HTML from our origin
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+# Open bundles, keyed by session id, least recently used first
+MAX_OPEN_BUNDLES = 64
+_open_bundles = OrderedDict()
+
+
+class BundleError(Exception):
+    """Raised when a bundle is missing, malformed or has an unknown version"""
+
+
+class BundleExistsError(BundleError):
+    """Raised when importing a bundle for a session that already exists"""
+
+
+class LessonBundle:
+    """Read-only, memory-mapped view over a packed lesson bundle"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise BundleError(f"Empty bundle: {path}")
+        self._view = memoryview(self._map)
+        self._lesson = None
+        # Identifies the file on disk, so a replaced bundle is noticed
+        stat = os.fstat(self._file.fileno())
+        self.stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        try:
+            self.entries = self._read_table()
+        except BundleError:
+            self.close()
+            raise
+
+    def _read_table(self) -> dict:
+        if len(self._map) < HEADER.size:
+            raise BundleError(f"Truncated bundle header: {self.path}")
+
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise BundleError(f"Not a lesson bundle: {self.path}")
+        if version != VERSION:
+            raise BundleError(f"Unsupported bundle version {version}: {self.path}")
+
+        entries = {}
+        pos = HEADER.size
+        try:
+            for _ in range(count):
+                (name_len,) = ENTRY_NAME.unpack_from(self._map, pos)
+                pos += ENTRY_NAME.size
+                name = bytes(self._map[pos:pos + name_len]).decode("utf-8")
+                pos += name_len
+                offset, length = ENTRY_SPAN.unpack_from(self._map, pos)
+                pos += ENTRY_SPAN.size
+                if offset + length > len(self._map):
+                    raise BundleError(f"Entry {name} runs past end of bundle: {self.path}")
+                entries[name] = (offset, length)
+        except struct.error:
+            raise BundleError(f"Truncated bundle offset table: {self.path}")
+        except UnicodeDecodeError:
+            raise BundleError(f"Invalid entry name in bundle: {self.path}")
+
+        return entries
+
+    def read(self, name: str) -> memoryview:
+        """Return a zero-copy view of an asset, or None if it is not in the bundle"""
+        span = self.entries.get(name)
+        if span is None:
+            return None
+        offset, length = span
+        return self._view[offset:offset + length]
+
+    def lesson(self) -> dict:
+        """Decode the lesson metadata (query, slides, quiz, asset names)"""
+        if self._lesson is None:
+            view = self.read(LESSON_ENTRY)
+            if view is None:
+                raise BundleError(f"Bundle has no {LESSON_ENTRY}: {self.path}")
+            # Copy out and drop the slice so a decode error never pins the mapping
+            data = bytes(view)
+            view.release()
+            try:
+                lesson = json.loads(data.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                raise BundleError(f"Invalid {LESSON_ENTRY} in bundle: {self.path}")
+            _validate_lesson(lesson, self.path)
+            self._lesson = lesson
+        return self._lesson
+
+    def close(self):
+        self._file.close()
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # A response is still streaming a slice; the mapping is freed with it
+            pass
+
+
+def _validate_lesson(lesson, path: str):
+    """Check lesson.json has the fields the API and quiz grading rely on"""
+    if not isinstance(lesson, dict):
+        raise BundleError(f"Invalid {LESSON_ENTRY} in bundle: {path}")
+
+    missing = [key for key in LESSON_KEYS if key not in lesson]
+    if missing:
+        raise BundleError(f"{LESSON_ENTRY} is missing {', '.join(missing)}: {path}")
+
+    slides = lesson['slides_content']
+    assets = lesson['assets']
+    quiz = lesson['quiz_questions']
+    if not isinstance(lesson['query'], str):
+        raise BundleError(f"Invalid query in bundle: {path}")
+    if not isinstance(slides, list) or not isinstance(assets, list) or len(slides) != len(assets):
+        raise BundleError(f"Slides and assets do not match in bundle: {path}")
+
+    # /quiz/evaluate grades levels 1-4 straight from these questions
+    if not isinstance(quiz, list) or len(quiz) != 4:
+        raise BundleError(f"Bundle must have exactly 4 quiz questions: {path}")
+    for question in quiz:
+        if (
+            not isinstance(question, dict)
+            or not isinstance(question.get('question'), str)
+            or not isinstance(question.get('options'), list)
+            or not isinstance(question.get('correct_answer'), str)
+        ):
+            raise BundleError(f"Invalid quiz question in bundle: {path}")
+
+    for slide, entry in zip(slides, assets):
+        if (
+            not isinstance(slide, dict)
+            or not isinstance(slide.get('title'), str)
+            or not isinstance(slide.get('content'), str)
+        ):
+            raise BundleError(f"Invalid slide in bundle: {path}")
+        if not isinstance(entry, dict) or not {"audio", "image", "imageType"} <= entry.keys():
+            raise BundleError(f"Invalid asset entry in bundle: {path}")
+
+
+def write_bundle(path: str, assets: dict):
+    """
+    Pack assets into a single bundle file.
+
+    Args:
+        path: Output file path
+        assets: Mapping of entry name to raw bytes
+    """
+    names = list(assets.keys())
+    encoded = [name.encode("utf-8") for name in names]
+
+    table_size = sum(ENTRY_NAME.size + len(n) + ENTRY_SPAN.size for n in encoded)
+    offset = HEADER.size + table_size
+
+    tmp_path = _temp_path(path)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names)))
+        for name, raw_name in zip(names, encoded):
+            length = len(assets[name])
+            f.write(ENTRY_NAME.pack(len(raw_name)))
+            f.write(raw_name)
+            f.write(ENTRY_SPAN.pack(offset, length))
+            offset += length
+        for name in names:
+            f.write(assets[name])
+
+    # Replace atomically so a mapped reader never sees a half-written bundle
+    os.replace(tmp_path, path)
+
+
+def _temp_path(path: str) -> str:
+    # Unique per writer, so concurrent workers never share a temp file
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def _copy_bundle(source_path: str, target_path: str):
+    tmp_path = _temp_path(target_path)
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _read_lesson(path: str) -> dict:
+    bundle = LessonBundle(path)
+    try:
+        return bundle.lesson()
+    finally:
+        bundle.close()
+
+
+def bundle_path(session_id: str) -> str:
+    # Session ids come from URLs and imported files, so only accept real UUIDs
+    try:
+        uuid.UUID(session_id)
+    except (ValueError, TypeError, AttributeError):
+        raise BundleError(f"Invalid session id: {session_id!r}")
+    return os.path.join(BUNDLE_DIR, f"{session_id}{BUNDLE_EXTENSION}")
+
+
+def open_bundle(session_id: str) -> LessonBundle:
+    """Get the (cached) memory-mapped bundle for a session, or None if absent"""
+    path = bundle_path(session_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _forget_bundle(session_id)
+        return None
+
+    bundle = _open_bundles.get(session_id)
+    if bundle is not None:
+        # Another worker may have replaced the file since it was mapped
+        if bundle.stat_key == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            _open_bundles.move_to_end(session_id)
+            return bundle
+        _forget_bundle(session_id)
+
+    bundle = LessonBundle(path)
+    _open_bundles[session_id] = bundle
+    while len(_open_bundles) > MAX_OPEN_BUNDLES:
+        _, evicted = _open_bundles.popitem(last=False)
+        evicted.close()
+    return bundle
+
+
+def _forget_bundle(session_id: str):
+    bundle = _open_bundles.pop(session_id, None)
+    if bundle is not None:
+        bundle.close()
+
+
+async def _fetch_image(client: httpx.AsyncClient, url: str):
+    """Download an image, returning (bytes, content type) or (None, None)"""
+    try:
+        response = await client.get(url)
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "image/jpeg").split(";")[0].strip().lower()
+        if content_type not in IMAGE_TYPES:
+            content_type = None
+        return response.content, content_type
+    except Exception as e:
+        print(f"    ⚠️ Image download failed: {e}")
+        return None, None
+
+
+async def export_bundle(session_id: str) -> str:
+    """
+    Pack a stored lesson (slides, quiz, narration audio, images) into a bundle.
+
+    Audio is read from AUDIO_DIR; images are downloaded once and cached in the
+    bundle. Missing assets are skipped so the lesson still exports.
+
+    Returns:
+        Path to the bundle file, or None if the session does not exist
+    """
+    session = await get_session(session_id)
+    if not session:
+        return None
+
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+
+    assets = {}
+    slide_assets = []
+
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+        for i, slide in enumerate(session['slides_content']):
+            entry = {"audio": None, "image": None, "imageType": None}
+
+            audio_file = os.path.join(AUDIO_DIR, f"{session_id}_slide_{i+1}.mp3")
+            if os.path.exists(audio_file):
+                entry["audio"] = f"audio/slide_{i+1}.mp3"
+                assets[entry["audio"]] = await asyncio.to_thread(_read_file, audio_file)
+
+            image_bytes, content_type = await _fetch_image(client, generate_image_url(slide['title']))
+            if image_bytes:
+                entry["image"] = f"images/slide_{i+1}"
+                entry["imageType"] = content_type
+                assets[entry["image"]] = image_bytes
+
+            slide_assets.append(entry)
+
+    lesson = {
+        "sessionId": session_id,
+        "query": session['query'],
+        "slides_content": session['slides_content'],
+        "quiz_questions": session['quiz_questions'],
+        "assets": slide_assets,
+    }
+    # Lesson metadata goes first so it sits next to the offset table
+    assets = {LESSON_ENTRY: json.dumps(lesson).encode("utf-8"), **assets}
+
+    path = bundle_path(session_id)
+    _forget_bundle(session_id)
+    await asyncio.to_thread(write_bundle, path, assets)
+    print(f" Bundle exported: {path} ({len(assets)} entries)")
+    return path
+
+
+async def import_bundle(source_path: str) -> str:
+    """
+    Import a bundle: store its session row and keep the bundle for serving.
+
+    No LLM or TTS calls are made; assets are served straight from the bundle.
+    Existing sessions are never overwritten: BundleExistsError is raised.
+
+    Returns:
+        The imported session id
+    """
+    lesson = await asyncio.to_thread(_read_lesson, source_path)
+
+    session_id = lesson['sessionId']
+    target_path = bundle_path(session_id)
+
+    # The primary-key insert is the claim: only one importer (or worker) wins
+    try:
+        await save_session(session_id, lesson['query'], lesson['slides_content'], lesson['quiz_questions'])
+    except sqlite3.IntegrityError:
+        raise BundleExistsError(f"Session already exists: {session_id}")
+
+    try:
+        os.makedirs(BUNDLE_DIR, exist_ok=True)
+        await asyncio.to_thread(_copy_bundle, source_path, target_path)
+    except Exception:
+        await delete_session(session_id)
+        raise
+
+    print(f" Bundle imported: {session_id}")
+    return session_id
+
+
+async def import_bundles(directory: str) -> dict:
+    """
+    Bulk-import every bundle in a directory, e.g. to seed a new deployment.
+
+    Returns:
+        Dictionary with the imported and already-present session ids and
+        per-file failures
+    """
+    imported = []
+    skipped = []
+    failed = {}
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(BUNDLE_EXTENSION):
+            continue
+        try:
+            imported.append(await import_bundle(os.path.join(directory, filename)))
+        except BundleExistsError:
+            skipped.append(filename)
+        except Exception as e:
+            print(f"    ⚠️ Bundle import failed for {filename}: {e}")
+            failed[filename] = str(e)
+
+    return {"imported": imported, "skipped": skipped, "failed": failed}
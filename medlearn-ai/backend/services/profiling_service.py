@@ -0,0 +1,418 @@
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from starlette.datastructures import Headers
+
+# Number of entries kept in the report summaries
+TOP_N = 25
+
+# Frames from these packages (and this module) are framework plumbing and
+# are left out of await chains, so the request's own code is what ranks
+_PLUMBING_PACKAGES = tuple(f"{os.sep}{name}{os.sep}" for name in ("asyncio", "anyio", "starlette", "fastapi"))
+
+# Profilers currently running in this process
+_active_profilers = 0
+
+
+# Settings are read on use (after load_dotenv) so .env changes take effect.
+# Profiling is opt-in: nothing is sampled unless a rate or header is used.
+def _env_number(name: str, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f" ⚠️ Invalid {name}, using {default}")
+        return default
+
+
+def profile_dir() -> str:
+    return os.getenv("PROFILE_DIR", "data/profiles")
+
+
+def should_profile(headers) -> bool:
+    """
+    Decide whether a request is profiled.
+
+    The profile header is only honoured when PROFILE_ADMIN_TOKEN is set and
+    the header carries that token; otherwise requests are sampled at
+    PROFILE_SAMPLE_RATE. At most PROFILE_MAX_ACTIVE profilers run at once.
+    """
+    if _active_profilers >= max(_env_number("PROFILE_MAX_ACTIVE", 2, int), 0):
+        return False
+
+    admin_token = os.getenv("PROFILE_ADMIN_TOKEN")
+    header = headers.get(os.getenv("PROFILE_HEADER", "X-Profile"))
+    if admin_token and header and secrets.compare_digest(header, admin_token):
+        return True
+
+    rate = _env_number("PROFILE_SAMPLE_RATE", 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def _frame_stack(frame) -> list:
+    """Turn a frame into a root-first list of 'file:function:line' labels"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _is_plumbing(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename == __file__ or any(package in filename for package in _PLUMBING_PACKAGES)
+
+
+def _await_stacks(task, prefix: list = None, depth: int = 0) -> list:
+    """
+    Follow a suspended task's await chain, outermost coroutine first.
+
+    When the task is waiting on another task (or a gather() of tasks), the
+    chain continues into those, so one request yields one stack per branch.
+    """
+    stack = list(prefix or [])
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        if not _is_plumbing(frame):
+            stack.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+
+    waiter = getattr(task, "_fut_waiter", None)
+    if isinstance(waiter, asyncio.Task):
+        children = [waiter]
+    else:
+        children = [child for child in getattr(waiter, "_children", ()) if isinstance(child, asyncio.Task)]
+
+    stacks = []
+    if depth < 8:
+        for child in children:
+            if not child.done():
+                stacks.extend(_await_stacks(child, stack, depth + 1))
+    if not stacks and stack:
+        stacks.append(stack)
+    return stacks
+
+
+class RequestProfiler:
+    """
+    Sampling profiler for one request, plus event-loop blocking detection.
+
+    A background thread samples the event-loop thread's stack every
+    PROFILE_INTERVAL_MS. A heartbeat scheduled on the loop lets the same
+    thread notice when a callback holds the loop longer than
+    PROFILE_BLOCK_THRESHOLD_MS, and record the stack that is holding it.
+
+    Time spent awaiting I/O (edge_tts, aiosqlite, httpx) leaves the loop
+    idle in select(), so each heartbeat also records the await chain of the
+    request's own task and the tasks it waits on, without framework frames.
+    These "awaiting" samples attribute wall time to the coroutine that is
+    waiting, e.g. generate_audio vs save_session.
+
+    The loop is shared, so samples include any other requests running
+    concurrently on it.
+    """
+
+    def __init__(self, method: str, path: str, task: asyncio.Task = None):
+        self.id = str(uuid.uuid4())
+        self.method = method
+        self.path = path
+        self._task = task
+        self.interval_ms = max(_env_number("PROFILE_INTERVAL_MS", 5.0), 1.0)
+        self.threshold_ms = _env_number("PROFILE_BLOCK_THRESHOLD_MS", 100.0)
+        self.interval = self.interval_ms / 1000
+        self.threshold = self.threshold_ms / 1000
+
+        self._stacks = Counter()
+        self._samples = 0
+        self._await_stacks = Counter()
+        self._await_samples = 0
+        self._blocks = []
+        self._current_block = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._beat_handle = None
+        self._last_beat = 0.0
+        self._started_at = None
+        self._start_time = 0.0
+        self._start_mono = 0.0
+
+    def start(self):
+        """Start sampling; must be called from the event-loop thread"""
+        global _active_profilers
+        _active_profilers += 1
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self._task is None:
+            self._task = asyncio.current_task()
+        self._started_at = datetime.now(timezone.utc).isoformat()
+        self._start_time = time.perf_counter()
+        self._start_mono = time.monotonic()
+        self._beat()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.id[:8]}", daemon=True)
+        self._thread.start()
+
+    def stop(self, status_code: int = None) -> dict:
+        """Stop sampling and return the report"""
+        global _active_profilers
+        _active_profilers -= 1
+        duration = time.perf_counter() - self._start_time
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+        self._stop.set()
+        self._thread.join()
+        self._close_block(time.monotonic())
+        return self._build_report(duration, status_code)
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        self._sample_tasks()
+        self._beat_handle = self._loop.call_later(self.interval, self._beat)
+
+    def _sample_tasks(self):
+        # Runs on the loop thread, so task state is safe to inspect here
+        if self._task is None or self._task.done():
+            return
+        stacks = _await_stacks(self._task)
+        for stack in stacks:
+            self._await_stacks[";".join(stack)] += 1
+        if stacks:
+            self._await_samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            stack = _frame_stack(frame)
+            self._stacks[";".join(stack)] += 1
+            self._samples += 1
+
+            now = time.monotonic()
+            stalled = now - self._last_beat - self.interval
+            if stalled >= self.threshold:
+                if self._current_block is None:
+                    # Keep the first stack seen: it is the callback holding the loop
+                    self._current_block = {"since": self._last_beat + self.interval, "stack": stack}
+            else:
+                self._close_block(now)
+
+    def _close_block(self, now: float):
+        block = self._current_block
+        if block is None:
+            return
+        self._current_block = None
+        # The loop resumed at the last heartbeat, or is still blocked at "now"
+        end = self._last_beat if self._last_beat > block["since"] else now
+        self._blocks.append({
+            "durationMs": round((end - block["since"]) * 1000, 1),
+            "offsetMs": round((block["since"] - self._start_mono) * 1000, 1),
+            "stack": block["stack"],
+        })
+
+    def _build_report(self, duration: float, status_code: int) -> dict:
+        def aggregate(stacks):
+            own = Counter()
+            cumulative = Counter()
+            for stack, count in stacks.items():
+                frames = stack.split(";")
+                own[frames[-1]] += count
+                for label in set(frames):
+                    cumulative[label] += count
+            return own, cumulative
+
+        def top(counter, total):
+            return [
+                {"frame": label, "samples": count, "percent": round(100 * count / total, 1)}
+                for label, count in counter.most_common(TOP_N)
+            ] if total else []
+
+        own, cumulative = aggregate(self._stacks)
+        await_own, await_cumulative = aggregate(self._await_stacks)
+
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "statusCode": status_code,
+            "startedAt": self._started_at,
+            "durationMs": round(duration * 1000, 1),
+            "intervalMs": self.interval_ms,
+            "blockThresholdMs": self.threshold_ms,
+            "samples": self._samples,
+            "topSelf": top(own, self._samples),
+            "topCumulative": top(cumulative, self._samples),
+            "awaitSamples": self._await_samples,
+            "topAwaiting": top(await_own, self._await_samples),
+            "topAwaitingCumulative": top(await_cumulative, self._await_samples),
+            "loopBlocks": self._blocks,
+            # Collapsed stacks ("a;b;c" -> samples), usable with flamegraph tools
+            "stacks": dict(self._stacks),
+            "awaitStacks": dict(self._await_stacks),
+        }
+
+
+def _write_report(report: dict):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{report['id']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f)
+
+    # Keep only the newest PROFILE_MAX_REPORTS reports
+    max_reports = max(_env_number("PROFILE_MAX_REPORTS", 200, int), 1)
+    reports = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")),
+        key=os.path.getmtime
+    )
+    for old in reports[:-max_reports]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+
+async def save_report(report: dict):
+    """Store a report locally without blocking the event loop; errors are logged"""
+    try:
+        await asyncio.to_thread(_write_report, report)
+        print(f" Profile saved: {report['id']} ({report['method']} {report['path']}, {report['durationMs']} ms)")
+    except Exception as e:
+        print(f" ⚠️ Failed to save profile {report['id']}: {e}")
+
+
+# Pending report writes, referenced so they are not garbage collected mid-write
+_pending_saves = set()
+
+
+def save_report_in_background(report: dict):
+    """Schedule a report write without delaying the response"""
+    task = asyncio.get_running_loop().create_task(save_report(report))
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles sampled API requests.
+
+    Requests that are not sampled pass straight through. A sampled request
+    is profiled until its final response body message has been sent, so
+    streamed responses are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith("/api/admin/")
+            or not should_profile(Headers(scope=scope))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = RequestProfiler(scope["method"], path)
+        profiler.start()
+        status_code = None
+        stopped = False
+
+        def finish():
+            nonlocal stopped
+            if stopped:
+                return
+            stopped = True
+            try:
+                save_report_in_background(profiler.stop(status_code))
+            except Exception as e:
+                print(f" ⚠️ Profiling failed for {path}: {e}")
+
+        async def send_profiled(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profiler.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            finish()
+
+
+def _list_reports() -> list:
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    summaries = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summaries.append({
+            "id": report["id"],
+            "method": report["method"],
+            "path": report["path"],
+            "statusCode": report["statusCode"],
+            "startedAt": report["startedAt"],
+            "durationMs": report["durationMs"],
+            "samples": report["samples"],
+            "loopBlocks": len(report["loopBlocks"]),
+            "longestBlockMs": max((b["durationMs"] for b in report["loopBlocks"]), default=0),
+        })
+
+    summaries.sort(key=lambda s: s["startedAt"], reverse=True)
+    return summaries
+
+
+async def list_reports() -> list:
+    """List stored reports, newest first"""
+    return await asyncio.to_thread(_list_reports)
+
+
+def _load_report(report_id: str):
+    path = os.path.join(profile_dir(), f"{report_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+async def get_report(report_id: str):
+    """Load a full report, or None if it does not exist"""
+    try:
+        uuid.UUID(report_id)
+    except ValueError:
+        return None
+    return await asyncio.to_thread(_load_report, report_id)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import db
+from services import bundle_service
+
+ADMIN = {"X-Admin-Token": "secret"}
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+MP3 = b"ID3" + os.urandom(200 * 1024)
+
+SLIDES = [
+    {"title": f"Slide {i}", "content": " Point", "narration": "Narration."}
+    for i in range(1, 5)
+]
+QUIZ = [
+    {"question": f"Q{i}?", "options": ["A", "B"], "correct_answer": "A", "explanation": "Because."}
+    for i in range(1, 5)
+]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("BUNDLE_ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "medlearn.db"))
+    monkeypatch.setattr(bundle_service, "BUNDLE_DIR", str(tmp_path / "bundles"))
+    monkeypatch.setattr(bundle_service, "AUDIO_DIR", str(tmp_path / "audio"))
+    monkeypatch.setattr("api.routes.BUNDLE_DIR", str(tmp_path / "bundles"))
+
+    async def fake_fetch_image(client, url):
+        return PNG, "image/png"
+
+    monkeypatch.setattr(bundle_service, "_fetch_image", fake_fetch_image)
+    bundle_service._open_bundles.clear()
+    asyncio.run(db.init_db())
+    yield TestClient(main.app)
+    bundle_service._open_bundles.clear()
+
+
+def _create_session(tmp_path) -> str:
+    session_id = str(uuid.uuid4())
+    asyncio.run(db.save_session(session_id, "heart", SLIDES, QUIZ))
+    os.makedirs(tmp_path / "audio", exist_ok=True)
+    for i in range(1, 5):
+        (tmp_path / "audio" / f"{session_id}_slide_{i}.mp3").write_bytes(MP3)
+    return session_id
+
+
+def _export(client, session_id) -> bytes:
+    response = client.post(f"/api/bundles/{session_id}/export", headers=ADMIN)
+    assert response.status_code == 200
+    return response.content
+
+
+def test_export_and_serve_assets(client, tmp_path):
+    session_id = _create_session(tmp_path)
+    _export(client, session_id)
+
+    lesson = client.get(f"/api/bundles/{session_id}").json()
+    assert lesson["slides"][0]["audioUrl"] == f"/api/bundles/{session_id}/assets/audio/slide_1.mp3"
+
+    audio = client.get(lesson["slides"][0]["audioUrl"])
+    assert audio.status_code == 200
+    assert audio.headers["content-type"] == "audio/mpeg"
+    assert audio.content == MP3
+
+    image = client.get(lesson["slides"][0]["imageUrl"])
+    assert image.headers["content-type"] == "image/png"
+    assert image.headers["x-content-type-options"] == "nosniff"
+    assert image.content == PNG
+
+
+def test_bundle_endpoints_require_admin_token(client, tmp_path):
+    session_id = _create_session(tmp_path)
+    response = client.post(f"/api/bundles/{session_id}/export", headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+
+def test_import_rejects_existing_session(client, tmp_path):
+    session_id = _create_session(tmp_path)
+    data = _export(client, session_id)
+
+    response = client.post("/api/bundles/import", headers=ADMIN, files={"file": ("lesson.mlb", data)})
+    assert response.status_code == 409
+
+
+def test_import_into_new_deployment(client, tmp_path, monkeypatch):
+    session_id = _create_session(tmp_path)
+    data = _export(client, session_id)
+
+    # Fresh database and bundle directory, as on a new deployment
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "fresh.db"))
+    monkeypatch.setattr(bundle_service, "BUNDLE_DIR", str(tmp_path / "fresh_bundles"))
+    bundle_service._open_bundles.clear()
+    asyncio.run(db.init_db())
+
+    response = client.post("/api/bundles/import", headers=ADMIN, files={"file": ("lesson.mlb", data)})
+    assert response.status_code == 200
+    assert response.json() == {"sessionId": session_id}
+
+    result = client.post("/api/quiz/evaluate", json={"sessionId": session_id, "level": 1, "answer": "A"})
+    assert result.json()["correct"] is True
+    assert client.get(f"/api/bundles/{session_id}/assets/audio/slide_4.mp3").content == MP3
+
+
+def test_import_rejects_incomplete_quiz(client, tmp_path):
+    lesson = {
+        "sessionId": str(uuid.uuid4()),
+        "query": "heart",
+        "slides_content": SLIDES,
+        "quiz_questions": [],
+        "assets": [{"audio": None, "image": None, "imageType": None}] * 4,
+    }
+    path = str(tmp_path / "bad.mlb")
+    bundle_service.write_bundle(path, {bundle_service.LESSON_ENTRY: json.dumps(lesson).encode("utf-8")})
+
+    with open(path, "rb") as f:
+        response = client.post("/api/bundles/import", headers=ADMIN, files={"file": ("bad.mlb", f)})
+    assert response.status_code == 400
+
+
+def test_concurrent_imports_keep_winner_bundle(client, tmp_path, monkeypatch):
+    session_id = _create_session(tmp_path)
+    _export(client, session_id)
+    source = str(tmp_path / "seed.mlb")
+    os.replace(bundle_service.bundle_path(session_id), source)
+
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "fresh.db"))
+    asyncio.run(db.init_db())
+
+    async def import_twice():
+        return await asyncio.gather(
+            bundle_service.import_bundle(source),
+            bundle_service.import_bundle(source),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(import_twice())
+    assert sorted(type(r).__name__ for r in results) == ["BundleExistsError", "str"]
+    assert os.path.exists(bundle_service.bundle_path(session_id))
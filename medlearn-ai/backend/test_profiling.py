@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from services import profiling_service
+
+
+async def synthesize_speech():
+    await asyncio.sleep(0.15)
+
+
+async def write_session():
+    await asyncio.to_thread(time.sleep, 0.1)
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(profiling_service.ProfilingMiddleware)
+
+    @app.get("/api/learn")
+    async def learn():
+        await synthesize_speech()
+        await write_session()
+        return {"ok": True}
+
+    @app.get("/api/stream")
+    async def stream():
+        async def body():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield b"chunk"
+        return StreamingResponse(body())
+
+    return app
+
+
+@pytest.fixture
+def reports(monkeypatch):
+    saved = []
+    monkeypatch.setattr(profiling_service, "save_report_in_background", saved.append)
+    monkeypatch.delenv("PROFILE_SAMPLE_RATE", raising=False)
+    monkeypatch.setenv("PROFILE_ADMIN_TOKEN", "secret")
+    return saved
+
+
+def test_profile_header_requires_admin_token(reports):
+    client = TestClient(_app())
+
+    response = client.get("/api/learn", headers={"X-Profile": "1"})
+    assert "x-profile-id" not in response.headers
+    assert reports == []
+
+    response = client.get("/api/learn", headers={"X-Profile": "secret"})
+    assert response.headers["x-profile-id"] == reports[0]["id"]
+
+
+def test_unsampled_requests_pass_through(reports):
+    response = TestClient(_app()).get("/api/learn")
+    assert response.json() == {"ok": True}
+    assert "x-profile-id" not in response.headers
+    assert reports == []
+
+
+def test_awaited_time_is_attributed_to_request_code(reports):
+    TestClient(_app()).get("/api/learn", headers={"X-Profile": "secret"})
+
+    cumulative = {entry["frame"].rsplit(":", 1)[0]: entry["percent"] for entry in reports[0]["topAwaitingCumulative"]}
+    assert cumulative["test_profiling.py:synthesize_speech"] > 30
+    assert cumulative["test_profiling.py:write_session"] > 20
+    assert not any("asyncio" in stack for stack in reports[0]["awaitStacks"])
+
+
+def test_streamed_response_is_measured_in_full(reports):
+    response = TestClient(_app()).get("/api/stream", headers={"X-Profile": "secret"})
+    assert response.content == b"chunk" * 3
+    assert reports[0]["durationMs"] >= 150
+
+
+def test_concurrent_profilers_are_capped(reports, monkeypatch):
+    monkeypatch.setenv("PROFILE_MAX_ACTIVE", "0")
+    response = TestClient(_app()).get("/api/learn", headers={"X-Profile": "secret"})
+    assert "x-profile-id" not in response.headers
+
+
+def test_invalid_settings_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setenv("PROFILE_INTERVAL_MS", "fast")
+    assert profiling_service.RequestProfiler("GET", "/api/learn").interval_ms == 5.0